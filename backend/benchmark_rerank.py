@@ -0,0 +1,141 @@
+"""
+benchmark_rerank.py
+
+Compares plain FAISS retrieval with two-stage retrieval (FAISS over-fetch +
+cross-encoder rerank) on latency, hit_rate@k, and prompt size. hit_rate@k is
+the share of queries with at least one relevant publication among the chunks
+that reach the prompt.
+
+Queries come from a JSONL file (--queries) with one object per line:
+    {"question": "...", "publication_ids": ["PMC123", ...]}
+Without one, queries are sampled from the index itself: the first sentence of
+a chunk is the question. The source chunk, and every other chunk whose text
+contains that sentence (chunks overlap, so the previous chunk of the section
+usually does), are held out of the results. A hit therefore needs a chunk
+from the same publication that does not contain the query text. Only
+publications with at least two chunks are sampled.
+
+Run from backend/:
+    python benchmark_rerank.py --samples 200 --large-top-k 20
+    python benchmark_rerank.py --with-llm --samples 20   # end-to-end, calls Ollama
+"""
+
+import argparse
+import random
+import re
+import time
+from collections import Counter
+import ujson as json
+import numpy as np
+
+from services import faiss_service
+from services.faiss_service import load_index_and_model, query_faiss
+from services.ask_service import build_prompt, candidate_count, select_context, RERANK_CANDIDATES_DEFAULT, RERANK_BUDGET_MS_DEFAULT
+from services.ollama_service import ask_ollama
+from services.rerank_service import load_reranker
+
+def load_queries(path):
+    with open(path, "r", encoding="utf-8") as fh:
+        rows = [json.loads(line) for line in fh if line.strip()]
+    return [(r["question"], set(r["publication_ids"]), None) for r in rows]
+
+HOLD_OUT_SLACK = 5  # extra FAISS results fetched to make up for held-out chunks
+
+def normalize_ws(text):
+    return " ".join(text.split())
+
+def chunk_key(c):
+    # chunk_id alone may be a per-section index on older indexes, so qualify it
+    return (c.get("publication_id", ""), c.get("section", ""), str(c.get("chunk_id", c.get("chunk_index", ""))))
+
+def sample_queries(n, seed):
+    """
+    Build (question, {publication_id}, held_out_key) triples from random chunks
+    in the index; held_out_key identifies the source chunk to drop from results
+    (chunks containing the question are dropped too, see is_held_out).
+    """
+    rng = random.Random(seed)
+    per_pub = Counter(m.get("publication_id", "") for m in faiss_service.metadata)
+    pool = [m for m in faiss_service.metadata if per_pub[m.get("publication_id", "")] >= 2]
+    queries = []
+    for meta in rng.sample(pool, min(len(pool), n * 3)):
+        sentence = re.split(r"(?<=[.!?])\s+", meta.get("text_preview", "").strip())[0]
+        if len(sentence.split()) >= 6:
+            meta = dict(meta, chunk_id=str(meta.get("chunk_id") or meta.get("chunk_index", "")))
+            queries.append((sentence, {meta.get("publication_id", "")}, chunk_key(meta)))
+        if len(queries) == n:
+            break
+    return queries
+
+def is_held_out(chunk, question, held_out):
+    """
+    True for the query's source chunk and for any chunk that contains the
+    query sentence verbatim (e.g. the overlapping previous chunk).
+    """
+    if held_out is None:
+        return False
+    return chunk_key(chunk) == held_out or normalize_ws(question) in normalize_ws(chunk.get("text_preview", ""))
+
+def run_config(queries, top_k, rerank, candidates, budget_ms, with_llm):
+    latencies, hits, prompt_chars, fallbacks = [], 0, [], 0
+    for question, relevant, held_out in queries:
+        t0 = time.perf_counter()
+        n = candidate_count(top_k, rerank, candidates)
+        fetched = query_faiss(question, n + (HOLD_OUT_SLACK if held_out is not None else 0))
+        fetched = [c for c in fetched if not is_held_out(c, question, held_out)][:n]
+        chunks, reranked = select_context(question, fetched, top_k, rerank, budget_ms)
+        prompt = build_prompt(question, chunks)
+        if with_llm:
+            ask_ollama(prompt)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        hits += any(c["publication_id"] in relevant for c in chunks)
+        prompt_chars.append(len(prompt))
+        fallbacks += rerank and not reranked
+    lat = np.array(latencies)
+    return {
+        "hit_rate": hits / len(queries),
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p95_ms": float(np.percentile(lat, 95)),
+        "mean_ms": float(lat.mean()),
+        "prompt_chars": float(np.mean(prompt_chars)),
+        "fallbacks": fallbacks,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reranked vs. large-top_k retrieval.")
+    parser.add_argument("--queries", help="JSONL file with question/publication_ids")
+    parser.add_argument("--samples", type=int, default=200, help="sampled queries when --queries is not given")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top-k", type=int, default=5, help="chunks kept in the prompt")
+    parser.add_argument("--large-top-k", type=int, default=20, help="baseline: plain FAISS with a large top_k")
+    parser.add_argument("--candidates", type=int, default=RERANK_CANDIDATES_DEFAULT, help="FAISS over-fetch for reranking")
+    parser.add_argument("--budget-ms", type=float, default=RERANK_BUDGET_MS_DEFAULT, help="rerank time budget per query")
+    parser.add_argument("--with-llm", action="store_true", help="include the Ollama call in latency (end-to-end)")
+    args = parser.parse_args()
+
+    load_index_and_model()
+    load_reranker()
+    queries = load_queries(args.queries) if args.queries else sample_queries(args.samples, args.seed)
+    if not queries:
+        print("No queries to run.")
+        return
+
+    configs = [
+        (f"faiss top_k={args.top_k}", args.top_k, False),
+        (f"faiss top_k={args.large_top_k}", args.large_top_k, False),
+        (f"rerank {args.candidates}->{args.top_k}", args.top_k, True),
+    ]
+    # Warm-up so first-call overhead is not billed to the first config (and no real query gets cached)
+    run_config([("warm-up query about spaceflight", set(), None)], args.top_k, True, args.candidates, args.budget_ms, False)
+
+    print(f"Queries: {len(queries)}  ({'end-to-end with LLM' if args.with_llm else 'retrieval + prompt build only'})")
+    print(f"{'config':24s} {'hit_rate@k':>10s} {'p50 ms':>8s} {'p95 ms':>8s} {'mean ms':>8s} {'prompt chars':>13s} {'fallbacks':>10s}")
+    for label, top_k, rerank in configs:
+        r = run_config(queries, top_k, rerank, args.candidates, args.budget_ms, args.with_llm)
+        print(
+            f"{label:24s} {r['hit_rate']:10.3f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} "
+            f"{r['mean_ms']:8.1f} {r['prompt_chars']:13.0f} {r['fallbacks']:10d}"
+        )
+
+if __name__ == "__main__":
+    main()
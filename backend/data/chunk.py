@@ -5,31 +5,82 @@ Reads per-publication JSONs from data/raw/ (created by ingest.py),
 chunks sections into smaller overlapping pieces, and writes
 chunk JSONs into data/chunks/ for embedding and retrieval.
 
+Chunks are sized in embedding-model tokens so nothing is truncated at
+encode time, and articles are processed across a process pool. A report
+compares truncated tokens against the legacy 250-word chunker.
+
 Each chunk JSON contains:
+- chunk_id: deterministic id (also the filename stem)
 - text: the chunk text
 - section: the canonical section name (Results, Conclusion, etc.)
 - publication_id: the source article's ID
 - chunk_index: order of the chunk in that section
 """
 
+import argparse
+import bisect
+import hashlib
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+# Tokenizers' own thread pool does not survive fork; the process pool gives us parallelism instead
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
 import ujson as json
 from pathlib import Path
+from transformers import AutoTokenizer
+from tqdm import tqdm
 
 # Directories
 RAW_DIR = Path("data/raw")
 CHUNKS_DIR = Path("data/chunks")
 CHUNKS_DIR.mkdir(parents=True, exist_ok=True)
+TMP_CHUNKS_DIR = CHUNKS_DIR.with_name(CHUNKS_DIR.name + ".tmp")  # staging dir, swapped in when a run succeeds
+OLD_CHUNKS_DIR = CHUNKS_DIR.with_name(CHUNKS_DIR.name + ".old")
 
-# Chunking parameters
+# Legacy word-based chunking parameters (kept for the truncation report)
 TARGET_WORDS = 250   # words per chunk
 OVERLAP_WORDS = 50   # overlap between consecutive chunks
 MAX_FILENAME_LEN = 100  # max characters for the JSON filename to avoid Windows path errors
 
-file_enum = 0
+# Token-based chunking parameters, aligned with the embedding model in embed_chunks.py
+TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MODEL_MAX_TOKENS = 256  # all-MiniLM-L6-v2 max_seq_length, including [CLS] and [SEP]
+TARGET_TOKENS = MODEL_MAX_TOKENS - 2  # room left for the special tokens
+OVERLAP_TOKENS = 32  # overlap between consecutive chunks
+MIN_SNAP_FILL = 0.5  # only snap to a sentence boundary if the chunk stays at least this full
+
+# Sentence starts: whitespace after terminal punctuation (optionally closed by quotes/brackets),
+# followed by something that looks like the start of a new sentence
+SENTENCE_BREAK_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+
+_tokenizer = None
+
+def get_tokenizer():
+    """
+    Load the tokenizer once per process (each pool worker gets its own copy).
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+    return _tokenizer
+
+def count_tokens(texts: list) -> list:
+    """
+    Number of model tokens (without special tokens) for each text.
+    """
+    if not texts:
+        return []
+    enc = get_tokenizer()(texts, add_special_tokens=False, verbose=False)
+    return [len(ids) for ids in enc["input_ids"]]
 
 def chunk_text(text: str, target_words=TARGET_WORDS, overlap=OVERLAP_WORDS):
     """
-    Split text into overlapping chunks.
+    Split text into overlapping word-count chunks.
+    Legacy chunker: 250 words routinely exceed the model's token limit, so
+    the tail of many chunks is truncated at encode time. Kept for comparison.
     """
     words = text.split()
     if len(words) <= target_words:
@@ -46,6 +97,66 @@ def chunk_text(text: str, target_words=TARGET_WORDS, overlap=OVERLAP_WORDS):
         start = end - overlap  # maintain overlap
     return chunks
 
+def chunk_text_tokens(text: str, target_tokens=TARGET_TOKENS, overlap=OVERLAP_TOKENS, snap_sentences=True):
+    """
+    Split text into overlapping chunks of at most target_tokens model tokens.
+    Chunk ends snap back to the last sentence boundary (or failing that, the
+    last word boundary) inside the window; chunk starts snap forward to a
+    sentence boundary inside the overlap region when there is one.
+    Chunks are slices of the original text, so whitespace and casing are kept.
+    """
+    if overlap >= target_tokens:
+        raise ValueError("overlap must be smaller than target_tokens")
+
+    enc = get_tokenizer()(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    offsets = enc["offset_mapping"]
+    n = len(offsets)
+    if n == 0:
+        return []
+    if n <= target_tokens:
+        return [text.strip()]
+
+    tok_starts = [o[0] for o in offsets]
+    # Token indices where a word / sentence begins (safe places to cut)
+    word_starts = [i for i in range(1, n) if offsets[i][0] > offsets[i - 1][1]]
+    sentence_starts = []
+    if snap_sentences:
+        for m in SENTENCE_BREAK_RE.finditer(text):
+            t = bisect.bisect_left(tok_starts, m.end())
+            if 0 < t < n and (not sentence_starts or sentence_starts[-1] != t):
+                sentence_starts.append(t)
+
+    def last_boundary_in(boundaries, lo, hi):
+        # largest boundary b with lo <= b <= hi, or None
+        k = bisect.bisect_right(boundaries, hi) - 1
+        return boundaries[k] if k >= 0 and boundaries[k] >= lo else None
+
+    def first_boundary_in(boundaries, lo, hi):
+        # smallest boundary b with lo <= b <= hi, or None
+        k = bisect.bisect_left(boundaries, lo)
+        return boundaries[k] if k < len(boundaries) and boundaries[k] <= hi else None
+
+    chunks = []
+    start = 0
+    min_fill = max(1, int(target_tokens * MIN_SNAP_FILL))
+    while start < n:
+        end = min(start + target_tokens, n)
+        if end < n:
+            cut = last_boundary_in(sentence_starts, start + min_fill, end)
+            if cut is None:
+                cut = last_boundary_in(word_starts, start + 1, end)
+            if cut is not None:
+                end = cut
+        chunks.append(text[offsets[start][0]:offsets[end - 1][1]])
+        if end == n:
+            break
+        next_start = max(end - overlap, start + 1)
+        snapped = first_boundary_in(sentence_starts, next_start, end - 1)
+        if snapped is None:
+            snapped = first_boundary_in(word_starts, next_start, end - 1)
+        start = snapped if snapped is not None else next_start
+    return chunks
+
 def prioritized_sections(sections: dict):
     """
     Return sections in order of priority:
@@ -59,50 +170,144 @@ def prioritized_sections(sections: dict):
             ordered.append((k, v))
     return ordered
 
+def make_chunk_id(pub_id: str, section: str, idx: int) -> str:
+    """
+    Deterministic chunk id from (publication, section, index).
+    Section titles are free text, so they are hashed rather than embedded,
+    which keeps ids filesystem-safe and stable across runs and workers.
+    """
+    safe_pub_id = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(pub_id))
+    section_key = hashlib.sha1(section.encode("utf-8")).hexdigest()[:10]
+    return f"{safe_pub_id}_{section_key}_{idx:04d}"
+
 def sanitize_chunk_filename(pub_id: str, section: str, idx: int, max_length=MAX_FILENAME_LEN) -> str:
     """
     Build a safe filename for a chunk JSON.
-    Truncates the combined string to max_length to avoid Windows path errors.
+    Truncates the publication id part to max_length to avoid Windows path errors,
+    keeping the section hash and index so names stay unique.
     """
-    base = f"{pub_id}_{section}_{idx}"
-    if len(base) > max_length:
-        base = base[:max_length]
-    return f"{base}.json"
+    chunk_id = make_chunk_id(pub_id, section, idx)
+    if len(chunk_id) > max_length:
+        chunk_id = chunk_id[-max_length:]
+    return f"{chunk_id}.json"
 
-def process_article(json_file: Path):
-    global file_enum
-    
-    article = json.load(open(json_file, "r", encoding="utf-8"))
+def process_article(json_file: Path, target_tokens=TARGET_TOKENS, overlap=OVERLAP_TOKENS, snap_sentences=True,
+                    out_dir: Path = CHUNKS_DIR):
+    """
+    Chunk one article and write its chunk JSONs into out_dir.
+    Returns stats comparing the token chunker with the legacy word chunker.
+    """
+    with open(json_file, "r", encoding="utf-8") as fh:
+        article = json.load(fh)
     pub_id = article["id"]
-    sections = article.get("sections", {})
+    sections = article.get("sections") or {}
+
+    stats = {
+        "chunks": 0, "tokens": 0, "truncated_chunks": 0, "truncated_tokens": 0,
+        "legacy_chunks": 0, "legacy_tokens": 0, "legacy_truncated_chunks": 0, "legacy_truncated_tokens": 0,
+    }
 
     for sec_name, sec_text in prioritized_sections(sections):
-        chunks = chunk_text(sec_text)
+        if not sec_text:
+            continue
+        chunks = chunk_text_tokens(sec_text, target_tokens, overlap, snap_sentences)
+        for prefix, token_counts in (("", count_tokens(chunks)), ("legacy_", count_tokens(chunk_text(sec_text)))):
+            over = [c - TARGET_TOKENS for c in token_counts if c > TARGET_TOKENS]
+            stats[prefix + "chunks"] += len(token_counts)
+            stats[prefix + "tokens"] += sum(token_counts)
+            stats[prefix + "truncated_chunks"] += len(over)
+            stats[prefix + "truncated_tokens"] += sum(over)
+
         for idx, c in enumerate(chunks):
             chunk_filename = sanitize_chunk_filename(pub_id, sec_name, idx)
-            chunk_filename = f"{file_enum}.json"
-            file_enum = file_enum + 1
-            chunk_file = CHUNKS_DIR / chunk_filename
-            json.dump(
-                {
-                    "text": c,
-                    "section": sec_name,
-                    "publication_id": pub_id,
-                    "chunk_index": idx,
-                },
-                open(chunk_file, "w", encoding="utf-8"),
-            )
+            with open(out_dir / chunk_filename, "w", encoding="utf-8") as fh:
+                json.dump(
+                    {
+                        "chunk_id": chunk_filename[:-len(".json")],
+                        "text": c,
+                        "section": sec_name,
+                        "publication_id": pub_id,
+                        "chunk_index": idx,
+                    },
+                    fh,
+                )
+    return stats
+
+def swap_in_chunks(staged: Path, target: Path = CHUNKS_DIR):
+    """
+    Replace target with the freshly written staged directory, so chunks from
+    earlier runs (legacy numeric names included) never reach embed_chunks.py.
+    """
+    shutil.rmtree(OLD_CHUNKS_DIR, ignore_errors=True)
+    if target.exists():
+        target.rename(OLD_CHUNKS_DIR)
+    staged.rename(target)
+    shutil.rmtree(OLD_CHUNKS_DIR, ignore_errors=True)
+
+def _process_article_job(args):
+    return process_article(*args)
+
+def print_report(totals: dict):
+    """
+    Compare how many tokens each chunker loses to encode-time truncation.
+    """
+    print(f"Truncation report (model limit: {TARGET_TOKENS} tokens + 2 special)")
+    for label, prefix in (("word chunker (legacy)", "legacy_"), ("token chunker", "")):
+        tokens = totals[prefix + "tokens"]
+        truncated = totals[prefix + "truncated_tokens"]
+        pct = 100.0 * truncated / tokens if tokens else 0.0
+        print(
+            f"  {label:22s} chunks: {totals[prefix + 'chunks']:7d}  tokens: {tokens:9d}  "
+            f"truncated chunks: {totals[prefix + 'truncated_chunks']:6d}  "
+            f"truncated tokens: {truncated:8d} ({pct:.1f}%)"
+        )
 
 def main():
-    json_files = list(RAW_DIR.glob("*.json"))
+    parser = argparse.ArgumentParser(description="Chunk raw article JSONs into token-sized pieces.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("--target-tokens", type=int, default=TARGET_TOKENS, help="max model tokens per chunk")
+    parser.add_argument("--overlap-tokens", type=int, default=OVERLAP_TOKENS, help="token overlap between chunks")
+    parser.add_argument("--no-sentence-snap", action="store_true", help="cut at word boundaries only")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.target_tokens < 1:
+        parser.error("--target-tokens must be at least 1")
+    if not 0 <= args.overlap_tokens < args.target_tokens:
+        parser.error("--overlap-tokens must be >= 0 and smaller than --target-tokens")
+    if args.target_tokens > TARGET_TOKENS:
+        print(f"Warning: --target-tokens {args.target_tokens} exceeds the model limit ({TARGET_TOKENS}); chunks will be truncated")
+
+    json_files = sorted(RAW_DIR.glob("*.json"))
     if not json_files:
         print("No raw JSON files found in", RAW_DIR)
         return
 
-    for jf in json_files:
-        process_article(jf)
+    # Write into a staging dir; data/chunks/ is only replaced once every article succeeded
+    shutil.rmtree(TMP_CHUNKS_DIR, ignore_errors=True)
+    TMP_CHUNKS_DIR.mkdir(parents=True)
+
+    jobs = [
+        (jf, args.target_tokens, args.overlap_tokens, not args.no_sentence_snap, TMP_CHUNKS_DIR)
+        for jf in json_files
+    ]
+    totals = {}
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = pool.map(_process_article_job, jobs, chunksize=8)
+            for stats in tqdm(results, total=len(jobs), desc="Chunking articles"):
+                for k, v in stats.items():
+                    totals[k] = totals.get(k, 0) + v
+    except BaseException:
+        shutil.rmtree(TMP_CHUNKS_DIR, ignore_errors=True)
+        print(f"Chunking failed; existing chunks in {CHUNKS_DIR} were left untouched.")
+        raise
+
+    swap_in_chunks(TMP_CHUNKS_DIR)
 
     print(f"Chunking complete. Chunks saved in: {CHUNKS_DIR.resolve()}")
+    print_report(totals)
 
 if __name__ == "__main__":
     main()
@@ -35,7 +35,7 @@ def load_chunks(chunks_dir: Path):
     """
     Read all chunk JSONs and return a list of chunk dicts.
     """
-    chunk_files = list(chunks_dir.glob("*.json"))
+    chunk_files = sorted(chunks_dir.glob("*.json"))  # stable index order across runs
     if not chunk_files:
         print("No chunk files found in", chunks_dir)
         return []
@@ -78,7 +78,7 @@ def build_faiss_index(chunks):
 
     metadata = [
         {
-            "chunk_id": f"{c['publication_id']}_{c['section']}_{c['chunk_index']}",
+            "chunk_id": c.get("chunk_id", f"{c['publication_id']}_{c['section']}_{c['chunk_index']}"),
             "publication_id": c["publication_id"],
             "section": c["section"],
             "chunk_index": c["chunk_index"],
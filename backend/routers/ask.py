@@ -1,17 +1,36 @@
 from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import List
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+import ujson as json
 from services.faiss_service import query_faiss
 from services.ollama_service import ask_ollama
+from services.ask_service import (
+    build_prompt, ask_batch, candidate_count, select_context,
+    MAX_CONCURRENCY_DEFAULT, RERANK_CANDIDATES_DEFAULT, RERANK_BUDGET_MS_DEFAULT,
+)
 
 router = APIRouter(prefix="/api/ask", tags=["System"])
 
 TOP_K_DEFAULT = 5
+TOP_K_LIMIT = 50
+MAX_BATCH_QUESTIONS = 1000
+MAX_CONCURRENCY_LIMIT = 32
+RERANK_CANDIDATES_LIMIT = 200
 
 # Pydantic models
-class AskRequest(BaseModel):
+class RetrievalOptions(BaseModel):
+    top_k: int = Field(TOP_K_DEFAULT, ge=1, le=TOP_K_LIMIT)  # chunks that go into the prompt
+    rerank: bool = False  # over-fetch from FAISS and keep the cross-encoder's best top_k
+    rerank_candidates: int = Field(RERANK_CANDIDATES_DEFAULT, ge=1, le=RERANK_CANDIDATES_LIMIT)
+    rerank_budget_ms: float = Field(RERANK_BUDGET_MS_DEFAULT, gt=0)
+
+class AskRequest(RetrievalOptions):
     question: str
-    top_k: int = TOP_K_DEFAULT
+
+class AskBatchRequest(RetrievalOptions):
+    questions: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_QUESTIONS)
+    max_concurrency: int = Field(MAX_CONCURRENCY_DEFAULT, ge=1, le=MAX_CONCURRENCY_LIMIT)
 
 class ChunkResult(BaseModel):
     chunk_id: str
@@ -20,15 +39,35 @@ class ChunkResult(BaseModel):
     link: str
     text_preview: str
     score: float
+    rerank_score: Optional[float] = None
 
 class AskResponse(BaseModel):
     answer: str
     context: List[ChunkResult]
+    reranked: bool = False
 
 @router.post("/", response_model=AskResponse)
 def ask(request: AskRequest):
-    top_chunks = query_faiss(request.question, request.top_k)
-    context_text = "\n\n".join([c["text_preview"] for c in top_chunks])
-    prompt = f"Use the following context to answer the question:\n\n{context_text}\n\nQuestion: {request.question}\nAnswer:"
+    candidates = query_faiss(request.question, candidate_count(request.top_k, request.rerank, request.rerank_candidates))
+    top_chunks, reranked = select_context(
+        request.question, candidates, request.top_k, request.rerank, request.rerank_budget_ms
+    )
+    prompt = build_prompt(request.question, top_chunks)
     answer = ask_ollama(prompt)
-    return AskResponse(answer=answer, context=[ChunkResult(**c) for c in top_chunks])
+    return AskResponse(answer=answer, context=[ChunkResult(**c) for c in top_chunks], reranked=reranked)
+
+@router.post("/batch")
+def ask_batch_stream(request: AskBatchRequest):
+    """
+    Stream answers as NDJSON, one line per question as each finishes.
+    Lines carry the input "index"; failed items have "error" instead of "answer".
+    """
+    def lines():
+        items = ask_batch(
+            request.questions, request.top_k, request.max_concurrency,
+            request.rerank, request.rerank_candidates, request.rerank_budget_ms,
+        )
+        for item in items:
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
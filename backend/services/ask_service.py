@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from services.faiss_service import query_faiss_batch
+from services.ollama_service import ask_ollama
+from services.rerank_service import rerank as rerank_chunks
+
+MAX_CONCURRENCY_DEFAULT = 4
+RERANK_CANDIDATES_DEFAULT = 50
+RERANK_BUDGET_MS_DEFAULT = 250
+
+def build_prompt(question: str, chunks: list):
+    context_text = "\n\n".join([c["text_preview"] for c in chunks])
+    return f"Use the following context to answer the question:\n\n{context_text}\n\nQuestion: {question}\nAnswer:"
+
+def candidate_count(top_k: int, rerank: bool, rerank_candidates: int = RERANK_CANDIDATES_DEFAULT):
+    """
+    How many chunks to fetch from FAISS: top_k, or an over-fetch when reranking.
+    """
+    return max(top_k, rerank_candidates) if rerank else top_k
+
+def select_context(question: str, candidates: list, top_k: int, rerank: bool = False,
+                   budget_ms: float = RERANK_BUDGET_MS_DEFAULT):
+    """
+    Pick the chunks that go into the prompt.
+    Returns (chunks, reranked); reranked is False when reranking is off or
+    the budget ran out before every candidate was scored (scored chunks then
+    come first, the rest follow in FAISS order).
+    """
+    if not rerank:
+        return candidates[:top_k], False
+    return rerank_chunks(question, candidates, top_k, budget_ms)
+
+def _answer(question: str, candidates: list, top_k: int, rerank: bool, budget_ms: float):
+    chunks, reranked = select_context(question, candidates, top_k, rerank, budget_ms)
+    return ask_ollama(build_prompt(question, chunks)), chunks, reranked
+
+def ask_batch(questions: list, top_k: int, max_concurrency: int = MAX_CONCURRENCY_DEFAULT,
+              rerank: bool = False, rerank_candidates: int = RERANK_CANDIDATES_DEFAULT,
+              budget_ms: float = RERANK_BUDGET_MS_DEFAULT):
+    """
+    Answer many questions at once.
+
+    All questions are embedded and searched in a single FAISS call, then the
+    LLM calls run on a bounded thread pool. Yields one dict per question as
+    soon as its answer is ready (completion order, not input order); each dict
+    carries the input "index" so callers can reorder. A failing question
+    yields an "error" entry instead of stopping the batch.
+
+    With rerank=True, rerank_candidates chunks are fetched per question and
+    the cross-encoder keeps the best top_k, within budget_ms per question.
+    """
+    try:
+        all_chunks = query_faiss_batch(questions, candidate_count(top_k, rerank, rerank_candidates))
+    except Exception as e:
+        # Retrieval failed for the whole batch; report it per item
+        for i, q in enumerate(questions):
+            yield {"index": i, "question": q, "error": f"retrieval failed: {e}"}
+        return
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+    try:
+        futures = {
+            pool.submit(_answer, q, chunks, top_k, rerank, budget_ms): (i, q)
+            for i, (q, chunks) in enumerate(zip(questions, all_chunks))
+        }
+        for future in as_completed(futures):
+            i, q = futures[future]
+            try:
+                answer, chunks, reranked = future.result()
+                yield {"index": i, "question": q, "answer": answer, "context": chunks, "reranked": reranked}
+            except Exception as e:
+                yield {"index": i, "question": q, "error": str(e)}
+    finally:
+        # Drop queued LLM calls if the consumer stops early (e.g. client disconnect)
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -24,22 +24,35 @@ def load_index_and_model():
     model = SentenceTransformer(EMBED_MODEL_NAME)
     print("FAISS index, metadata, and model loaded successfully.")
 
+def _hit_to_result(idx, score):
+    meta = metadata[idx]
+    return {
+        "chunk_id": str(meta.get("chunk_id") or meta.get("chunk_index", idx)),  # stable id, else chunk_index or FAISS idx
+        "publication_id": meta.get("publication_id", ""),
+        "section": meta.get("section", ""),
+        "link": meta.get("link", ""),  # will be empty since not in metadata
+        "text_preview": meta.get("text_preview", ""),
+        "score": float(score),
+    }
+
 def query_faiss(question: str, top_k: int):
-    q_vec = model.encode([question])
-    faiss.normalize_L2(q_vec)
-    D, I = index.search(q_vec, top_k)
-    results = []
-    for score, idx in zip(D[0], I[0]):
-        meta = metadata[idx]
-        results.append({
-            "chunk_id": str(meta.get("chunk_index", idx)),  # use chunk_index or FAISS idx
-            "publication_id": meta.get("publication_id", ""),
-            "section": meta.get("section", ""),
-            "link": meta.get("link", ""),  # will be empty since not in metadata
-            "text_preview": meta.get("text_preview", ""),
-            "score": float(score),
-        })
+    return query_faiss_batch([question], top_k)[0]
 
+def query_faiss_batch(questions: list, top_k: int):
+    """
+    Encode all questions in one batch and run a single matrix search.
+    Returns one list of chunk results per question, in input order.
+    """
+    if not questions:
+        return []
+    q_vecs = model.encode(questions, convert_to_numpy=True, show_progress_bar=False)
+    q_vecs = np.ascontiguousarray(q_vecs, dtype="float32")
+    faiss.normalize_L2(q_vecs)
+    D, I = index.search(q_vecs, top_k)
+    results = []
+    for scores, idxs in zip(D, I):
+        # FAISS pads with -1 when the index holds fewer than top_k vectors
+        results.append([_hit_to_result(idx, score) for score, idx in zip(scores, idxs) if idx >= 0])
     return results
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+import time
+import threading
+from collections import OrderedDict
+from sentence_transformers import CrossEncoder
+
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"  # small, CPU friendly
+RERANK_BATCH_SIZE = 16
+RERANK_MAX_LENGTH = 256
+CACHE_SIZE = 20000  # (question, chunk) scores kept in memory
+LATENCY_SMOOTHING = 0.2  # weight of the newest batch in the running batch latency
+
+# Global variables
+reranker: CrossEncoder = None
+_load_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_score_cache = OrderedDict()
+_batch_latency = 0.0  # running estimate of one predict() batch, in seconds
+
+def load_reranker():
+    """
+    Load the cross-encoder on first use so the default /api/ask path does not pay for it.
+    """
+    global reranker
+    with _load_lock:
+        if reranker is None:
+            print("Loading reranker model...")
+            model = CrossEncoder(RERANK_MODEL_NAME, max_length=RERANK_MAX_LENGTH, device="cpu")
+            # Time one full batch (text_preview is at most 400 chars) to seed the latency estimate
+            warmup = [("warm-up question", "x " * 200)] * RERANK_BATCH_SIZE
+            t0 = time.perf_counter()
+            model.predict(warmup, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False)
+            _record_batch_latency(time.perf_counter() - t0)
+            reranker = model
+            print("Reranker loaded successfully.")
+    return reranker
+
+def _record_batch_latency(seconds: float):
+    global _batch_latency
+    with _cache_lock:
+        if _batch_latency == 0.0:
+            _batch_latency = seconds
+        else:
+            _batch_latency += LATENCY_SMOOTHING * (seconds - _batch_latency)
+
+def _batch_latency_estimate() -> float:
+    with _cache_lock:
+        return _batch_latency
+
+def _cache_get(key):
+    with _cache_lock:
+        score = _score_cache.get(key)
+        if score is not None:
+            _score_cache.move_to_end(key)
+        return score
+
+def _cache_put(key, score):
+    with _cache_lock:
+        _score_cache[key] = score
+        _score_cache.move_to_end(key)
+        while len(_score_cache) > CACHE_SIZE:
+            _score_cache.popitem(last=False)
+
+def rerank(question: str, candidates: list, keep: int, budget_ms: float):
+    """
+    Re-score FAISS candidates with the cross-encoder and keep the best `keep`.
+
+    Candidates are scored in batches, in FAISS order, with cached scores reused.
+    Before every batch (the first included) we check whether it fits in what
+    is left of the budget, using a running batch latency shared across
+    requests (seeded at load, so concurrent callers slowing each other down
+    are accounted for). The one-off model load is not counted.
+
+    If the budget runs out, the candidates scored so far are ranked by the
+    cross-encoder and the unscored ones follow in FAISS order, so no scoring
+    work is thrown away. The budget bounds when a new batch may start; a
+    batch that is already running is never interrupted.
+
+    Returns (chunks, reranked) where reranked is False if any candidate was
+    left unscored.
+    """
+    if not candidates:
+        return [], False
+
+    model = load_reranker()
+    deadline = time.perf_counter() + budget_ms / 1000.0
+
+    scores = [_cache_get((question, c["text_preview"])) for c in candidates]
+    pending = [i for i, s in enumerate(scores) if s is None]
+
+    slowest_batch = 0.0
+    for b in range(0, len(pending), RERANK_BATCH_SIZE):
+        expected = max(_batch_latency_estimate(), slowest_batch)
+        if time.perf_counter() + expected > deadline:
+            break
+        batch = pending[b:b + RERANK_BATCH_SIZE]
+        t0 = time.perf_counter()
+        batch_scores = model.predict(
+            [(question, candidates[i]["text_preview"]) for i in batch],
+            batch_size=RERANK_BATCH_SIZE,
+            show_progress_bar=False,
+        )
+        elapsed = time.perf_counter() - t0
+        slowest_batch = max(slowest_batch, elapsed)
+        _record_batch_latency(elapsed)
+        for i, s in zip(batch, batch_scores):
+            scores[i] = float(s)
+            _cache_put((question, candidates[i]["text_preview"]), scores[i])
+
+    scored = sorted((i for i, s in enumerate(scores) if s is not None), key=lambda i: scores[i], reverse=True)
+    unscored = [i for i, s in enumerate(scores) if s is None]
+    results = [dict(candidates[i], rerank_score=scores[i]) for i in scored]
+    results += [candidates[i] for i in unscored]
+    return results[:keep], not unscored